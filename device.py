@@ -15,6 +15,8 @@ class Device(object):
     """
     __devices = list()
     __callbacks = dict()
+    __callback_armed_at = sys.maxsize   # deadline last handed to the emulator
+    __callback_dispatching = False      # defer re-arming while __callback runs
 
     __emu = None
     __root_device = None
@@ -146,12 +148,14 @@ class Device(object):
             'cycle': cb_at,
             'func': cb_func
         }
-        Device.__set_callback()
+        if not Device.__callback_dispatching:
+            Device.__set_callback()
 
     @classmethod
     def __remove_callback(cls, cb_dev, cb_name):
         Device.__callbacks.pop((cb_dev, cb_name), None)
-        Device.__set_callback()
+        if not Device.__callback_dispatching:
+            Device.__set_callback()
 
     @classmethod
     def __set_callback(cls):
@@ -159,28 +163,32 @@ class Device(object):
         Arrange to be called back at the earliest future deadline.
         """
         earliest = sys.maxsize
-        earliest_handle = None
-        for ident, info in Device.__callbacks.items():
+        for info in Device.__callbacks.values():
             cycle = info['cycle']
             if (cycle > Device.__emu.current_cycle) and (cycle < earliest):
                 earliest = cycle
-                _, earliest_handle = ident
-        if earliest < sys.maxsize:
+        # only go back to the emulator (and CPU timeslice) if the deadline moved
+        if (earliest < sys.maxsize) and (earliest != Device.__callback_armed_at):
+            Device.__callback_armed_at = earliest
             Device.__emu.set_device_callback(earliest, Device.__callback)
 
     @classmethod
     def __callback(cls):
         """
-        invoke every callback that's due
+        invoke every callback that's due, then re-arm once for the next deadline
         """
-        ident_list = list(Device.__callbacks.keys())
-        for ident in ident_list:
-            info = Device.__callbacks[ident]
-            if info['cycle'] <= Device.__emu.current_cycle:
-                _, handle = ident
-                func = info['func']
-                Device.__callbacks.pop(ident, False)
-                func()
+        Device.__callback_armed_at = sys.maxsize
+        Device.__callback_dispatching = True
+        try:
+            ident_list = list(Device.__callbacks.keys())
+            for ident in ident_list:
+                info = Device.__callbacks.get(ident)
+                if (info is not None) and (info['cycle'] <= Device.__emu.current_cycle):
+                    func = info['func']
+                    Device.__callbacks.pop(ident, False)
+                    func()
+        finally:
+            Device.__callback_dispatching = False
         Device.__set_callback()
 
     ########################################
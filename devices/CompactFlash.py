@@ -307,19 +307,13 @@ class CompactFlash(Device):
                 raise RuntimeError('unexpected disk file read error')
 
             self._bytes_remaining -= count
-            if count == 1:
-                return data[0]
-            else:
-                return (data[1] << 8) + data[0]
+            return int.from_bytes(data, 'little')
 
         elif self._current_mode == AMODE_IDENTIFY:
 
             index = SECTOR_SIZE - self._bytes_remaining
             self._bytes_remaining -= count
-            if count == 1:
-                return self._identify_data[index]
-            else:
-                return (self._identify_data[index + 1] << 8) + self._identify_data[index]
+            return int.from_bytes(self._identify_data[index:index + count], 'little')
 
         else:
             raise RuntimeError('oops')
@@ -329,10 +323,10 @@ class CompactFlash(Device):
             self.trace(info=f'ERROR: data write when not writing')
             return 0
 
-        data = bytearray()
-        data.append(value & 0xff)
-        if width == m68k.MEM_SIZE_16:
-            data.append(value >> 8)
+        if width == m68k.MEM_SIZE_8:
+            data = (value & 0xff).to_bytes(1, 'little')
+        else:
+            data = (value & 0xffff).to_bytes(2, 'little')
 
         if self._bytes_remaining < len(data):
             self.trace(info=f'ERROR: write beyond sector buffer')
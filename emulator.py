@@ -78,8 +78,11 @@ class Emulator(object):
         # time
         self._cpu_frequency = frequency
         self._elapsed_cycles = 0
+        self._executing = False
         self._device_deadline = 0
-        self._default_quantum = int(self._cpu_frequency / 1000)  # ~1ms in cycles
+        # Devices shorten the quantum with their callbacks, so when nothing is
+        # scheduled let the CPU run for longer between trips back to Python.
+        self._max_quantum = int(self._cpu_frequency / 10)  # ~100ms in cycles
         self._device_callback_at = sys.maxsize
         self._device_callback_fn = None
 
@@ -154,9 +157,9 @@ class Emulator(object):
     def run(self):
         if self._load_image is not None:
             # relocate to the load address & write to memory
-            sections = self._load_image.relocate(self._load_address)
-            for section_address, section_data in sections.items():
-                m68k.mem_write_bulk(section_address, section_data)
+            segments = self._load_image.relocate(self._load_address)
+            for segment_address, segment_data in segments.items():
+                m68k.mem_write_bulk(segment_address, segment_data)
 
             # patch the initial stack and entrypoint
             _, stack_limit = self._load_image.get_symbol_range('__STACK__')
@@ -173,27 +176,38 @@ class Emulator(object):
         # reset the CPU ready for execution
         m68k.pulse_reset()
 
+        # Limits and deadlines are changed by callbacks while execute() runs,
+        # so they are re-read from self each time round; only the functions
+        # and constants are bound to locals.
+        execute = m68k.execute
+        trace = self._trace.trace
+        max_quantum = self._max_quantum
+
         self._start_time = time.time()
         while not self._dead:
 
-            quantum = self._default_quantum
-            if (self._elapsed_cycles + quantum) > self._device_callback_at:
-                quantum = self._device_callback_at - self._elapsed_cycles
-            if (self._elapsed_cycles + quantum) > self._cycle_limit:
-                quantum = self._cycle_limit - self._elapsed_cycles
-            if (self._elapsed_cycles + quantum) > self._trace_cycle_limit:
-                quantum = self._trace_cycle_limit - self._elapsed_cycles
-
-            self.trace(action='RUN', info=f'quantum {quantum} cycles @ {self._elapsed_cycles}')
-            run_count = m68k.execute(quantum)
-            self.trace(action='STOP', info=f'ran for {run_count} cycles')
-            self._elapsed_cycles += run_count
-
-            if self._elapsed_cycles >= self._cycle_limit:
+            elapsed_cycles = self._elapsed_cycles
+            quantum = max_quantum
+            if (elapsed_cycles + quantum) > self._device_callback_at:
+                quantum = self._device_callback_at - elapsed_cycles
+            if (elapsed_cycles + quantum) > self._cycle_limit:
+                quantum = self._cycle_limit - elapsed_cycles
+            if (elapsed_cycles + quantum) > self._trace_cycle_limit:
+                quantum = self._trace_cycle_limit - elapsed_cycles
+
+            trace(action='RUN', info=f'quantum {quantum} cycles @ {elapsed_cycles}')
+            self._executing = True
+            run_count = execute(quantum)
+            self._executing = False
+            trace(action='STOP', info=f'ran for {run_count} cycles')
+            elapsed_cycles += run_count
+            self._elapsed_cycles = elapsed_cycles
+
+            if elapsed_cycles >= self._cycle_limit:
                 self.fatal('cycle limit exceeded')
-            if self._elapsed_cycles >= self._trace_cycle_limit:
+            if elapsed_cycles >= self._trace_cycle_limit:
                 self._trace.enable('everything', False)
-            if self._elapsed_cycles >= self._device_callback_at:
+            if elapsed_cycles >= self._device_callback_at:
                 self._device_callback_at = sys.maxsize
                 self._device_callback_fn()
 
@@ -209,8 +223,10 @@ class Emulator(object):
 
         self._device_callback_at = device_callback_at
         callback_after = device_callback_at - self.current_cycle
-        if callback_after < m68k.cycles_remaining():
-            m68k.modify_timeslice(callback_after)
+        remaining = m68k.cycles_remaining()
+        if callback_after < remaining:
+            # modify_timeslice adjusts the remaining cycles by a delta
+            m68k.modify_timeslice(callback_after - remaining)
         self._device_callback_fn = device_callback_fn
 
     def add_memory(self, base, size, writable=True, from_file=None):
@@ -251,7 +267,9 @@ class Emulator(object):
         """
         Return the number of the current clock cycle (cycles elapsed since reset)
         """
-        return self._elapsed_cycles + m68k.cycles_run()
+        if self._executing:
+            return self._elapsed_cycles + m68k.cycles_run()
+        return self._elapsed_cycles
 
     @property
     def cycle_rate(self):
@@ -302,7 +320,7 @@ class Emulator(object):
         func_code = m68k.mem_read_memory(argptr, m68k.MEM_SIZE_32)
         try:
             func_name = self.nf_map[func_code]
-        except KeyEror:
+        except KeyError:
             return m68k.ILLG_ERROR
 
         if func_name == 'NF_VERSION':
@@ -312,7 +330,7 @@ class Emulator(object):
         elif func_name == 'NF_SHUTDOWN':
             self.fatal('shutdown requested')
         elif func_name == 'NF_CTRL':
-            self._nf_trace(argptr + 4)
+            return self._nf_ctl(argptr + 4)
         elif func_name == 'NF_DISKIO':
             m68k.set_reg(m68k.REG_D0, 0 if self._nf_diskio(argptr + 4) else 1)
         else:
@@ -327,8 +345,8 @@ class Emulator(object):
         return m68k.ILLG_OK
 
     def _nf_ctl(self, argptr):
-        cmd = m68k_read_memory(argptr, m68k.MEM_SIZE_32)
-        arg = m68k_read_memory(argptr + 4, m68k.MEM_SIZE_32)
+        cmd = m68k.mem_read_memory(argptr, m68k.MEM_SIZE_32)
+        arg = m68k.mem_read_memory(argptr + 4, m68k.MEM_SIZE_32)
 
         try:
             op = self.nf_ctl_ops[cmd]
@@ -355,9 +373,9 @@ class Emulator(object):
         return m68k.ILLG_OK
 
     def _nf_diskio(self, argptr):
-        cmd = m68k_read_memory(argptr, m68k.MEM_SIZE_32)
-        byteoff = m68k_read_memory(argptr + 4, m68k.MEM_SIZE_32) * 512
-        buf = m68k_read_memory(argptr + 8, m68k.MEM_SIZE_32)
+        cmd = m68k.mem_read_memory(argptr, m68k.MEM_SIZE_32)
+        byteoff = m68k.mem_read_memory(argptr + 4, m68k.MEM_SIZE_32) * 512
+        buf = m68k.mem_read_memory(argptr + 8, m68k.MEM_SIZE_32)
 
         if self._nf_diskfile is None:
             return False
@@ -370,10 +388,7 @@ class Emulator(object):
                 m68k.mem_write_bulk(buf, blk)
                 return True
         elif cmd == 2:
-            blk = bytes()
-            while len(blk) < 512:
-                blk.append(m68k.mem_read_memory(buf, m68k.MEM_SIZE_32))
-                buf += 4
+            blk = m68k.mem_read_bulk(buf, 512)
             self._nf_diskfile.seek(byteoff)
             self._nf_diskfile.write(blk)
             return True
@@ -383,13 +398,9 @@ class Emulator(object):
         strptr = m68k.mem_read_memory(argptr, m68k.MEM_SIZE_32)
         if strptr == 0:
             return None
-        result = str()
-        while True:
-            c = m68k.mem_read_memory(strptr, m68k.MEM_SIZE_8)
-            if (c == 0) or (len(result) > 255):
-                return result
-            result += chr(c)
-            strptr += 1
+        # strings are limited to 256 characters
+        data = m68k.mem_read_bulk(strptr, 256)
+        return data.split(b'\0', 1)[0].decode('latin-1')
 
     def trace(self, action='', address=None, info=''):
         self._trace.trace(action=action, address=address, info=info)
@@ -1,10 +1,12 @@
 #
 # ELF image loader
 #
-from bisect import bisect_left
+from bisect import bisect_right
+import functools
+import mmap
 import os
 import struct
-import subprocess
+import sys
 
 # note - package is 'pyelftools'
 from elftools.elf.constants import SH_FLAGS
@@ -13,6 +15,9 @@ from elftools.elf.relocation import RelocationSection
 from elftools.elf.sections import SymbolTableSection
 
 R_68K_32 = 0x01
+STT_FILE = 0x04
+
+ELF32_SYM_FORMAT = '>LLLBBH'     # st_name, st_value, st_size, st_info, st_other, st_shndx
 
 
 class ELFImage(object):
@@ -26,14 +31,18 @@ class ELFImage(object):
         """
         self._name = os.path.basename(image_filename)
 
-        self._name_cache = dict()       # names are unique, entries are subdicts with 'address' and 'size'
+        self._name_cache = dict()       # names are unique, entries are (address, size) tuples
         self._address_cache = dict()    # addresses are not unique, entries are lists of names at that address
         self._symbol_index = None       # sorted list of unique symbol addresses + sentinel
+        self._symbol_ranges = None      # parallel to _symbol_index, tuples of (name, size) at that address
+        self._symbol_name_cache = functools.lru_cache(maxsize=65536)(self._lookup_symbol_name)
 
         self._symbols_only = symbols_only
         self._relocation = 0
+        self._loadable_segments = None  # segment address -> (read-only view of file contents, memory size)
 
-        self._elf = ELFFile(open(image_filename, "rb"))
+        self._elf_file = open(image_filename, "rb")
+        self._elf = ELFFile(self._elf_file)
         if self._elf.header['e_type'] != 'ET_EXEC':
             raise RuntimeError('not an ELF executable file')
         if self._elf.header['e_machine'] != 'EM_68K':
@@ -46,17 +55,25 @@ class ELFImage(object):
             if isinstance(section, SymbolTableSection):
                 self._cache_symbols(section)
 
-        # look for a stack
+        # look for a stack, and index the loadable segments; file contents are
+        # referenced via a read-only mapping of the image rather than copied
         stack_size = None
         if not self._symbols_only:
+            self._loadable_segments = dict()
+            image = memoryview(mmap.mmap(self._elf_file.fileno(), 0, access=mmap.ACCESS_READ))
             for segment in self._elf.iter_segments():
-                if segment['p_type'] == 'PT_GNU_STACK':
+                if segment['p_type'] == 'PT_LOAD':
+                    if segment['p_memsz'] > 0:
+                        file_offset = segment['p_offset']
+                        file_data = image[file_offset:file_offset + segment['p_filesz']]
+                        self._loadable_segments[segment['p_vaddr']] = (file_data, segment['p_memsz'])
+                elif segment['p_type'] == 'PT_GNU_STACK':
                     stack_size = segment['p_memsz']
             if stack_size is None:
                 raise RuntimeError(f'no stack defined in {self._name} - did you forget to link with -z stack-size=VALUE?')
             else:
                 try:
-                    stack_base = self._name_cache['_end']['address']
+                    stack_base, _ = self._name_cache['_end']
                 except KeyError:
                     raise RuntimeError('no _end symbol, cannot locate stack')
                 self._add_symbol('__STACK__', stack_base, stack_size)
@@ -65,26 +82,36 @@ class ELFImage(object):
         self._symbol_index = sorted(self._address_cache.keys())
         if len(self._symbol_index) == 0:
             raise RuntimeError(f'no symbols in {image_filename}')
+        self._symbol_ranges = [tuple((name, self._name_cache[name][1]) for name in self._address_cache[address])
+                               for address in self._symbol_index]
 
     def _add_symbol(self, name, address, size):
-        self._name_cache[name] = {'address': address, 'size': size}
+        self._name_cache[name] = (address, size)
         try:
             self._address_cache[address].append(name)
         except KeyError:
             self._address_cache[address] = [name]
 
-    def _get_loadable_sections(self):
+    def _get_loadable_segments(self):
         if self._symbols_only:
             raise RuntimeError(f'loaded for symbols-only')
-        loadable_sections = dict()
-        for section in self._elf.iter_sections():
-            if section['sh_flags'] & SH_FLAGS.SHF_ALLOC:
-                loadable_sections[section['sh_addr']] = bytearray(section.data())
-        return loadable_sections
+        loadable_segments = dict()
+        for seg_base, (file_data, mem_size) in self._loadable_segments.items():
+            # copy file contents straight into a zeroed buffer, leaving the tail as BSS
+            seg_data = bytearray(mem_size)
+            seg_data[:len(file_data)] = file_data
+            loadable_segments[seg_base] = seg_data
+        return loadable_segments
 
     def relocate(self, relocation):
-        # find sections that we want to load
-        loadable_sections = self._get_loadable_sections()
+        # find segments that we want to load, and index them by address
+        loadable_segments = self._get_loadable_segments()
+        seg_bases = sorted(loadable_segments.keys())
+        seg_limits = [base + len(loadable_segments[base]) for base in seg_bases]
+        seg_views = [memoryview(loadable_segments[base]) for base in seg_bases]
+
+        unpack_from = struct.unpack_from
+        pack_into = struct.pack_into
 
         # iterate relocation sections
         did_relocate = False
@@ -97,34 +124,39 @@ class ELFImage(object):
             if not (reloc_section['sh_flags'] & SH_FLAGS.SHF_ALLOC):
                 continue
 
-            # iterate relocations
-            for reloc in section.iter_relocations():
-                if not reloc.is_RELA():
-                    raise RuntimeError('unexpected REL reloc')
+            for reloc_address in self._relocation_targets(section):
 
-                # Only R_68K_32 relocations are of interest
-                if reloc['r_info_type'] != R_68K_32:
+                # find the segment containing the address that needs to be fixed up
+                index = bisect_right(seg_bases, reloc_address) - 1
+                if (index < 0) or (reloc_address >= seg_limits[index]):
                     continue
-
-                # find the section containing the address that needs to be fixed up
-                reloc_address = reloc['r_offset']
-                for sec_base, sec_data in loadable_sections.items():
-                    sec_offset = reloc_address - sec_base
-                    if (sec_base <= reloc_address) and (sec_offset < len(sec_data)):
-                        unrelocated_value = struct.unpack_from('>L', sec_data, sec_offset)[0]
-                        struct.pack_into('>L', sec_data, sec_offset, unrelocated_value + relocation)
-                        did_relocate = True
-                        break
+                seg_view = seg_views[index]
+                seg_offset = reloc_address - seg_bases[index]
+                unrelocated_value = unpack_from('>L', seg_view, seg_offset)[0]
+                pack_into('>L', seg_view, seg_offset, (unrelocated_value + relocation) & 0xffffffff)
+                did_relocate = True
 
         if not did_relocate:
             raise RuntimeError(f'no relocations in {self._name} - did you forget to link with --emit-relocs?')
 
-        relocated_sections = dict()
-        for sec_base, sec_data in loadable_sections.items():
-            relocated_sections[sec_base + relocation] = sec_data
+        relocated_segments = dict()
+        for seg_base, seg_data in loadable_segments.items():
+            relocated_segments[seg_base + relocation] = seg_data
 
         self._relocation = relocation
-        return relocated_sections
+        self._symbol_name_cache.cache_clear()
+        return relocated_segments
+
+    def _relocation_targets(self, section):
+        # Only R_68K_32 relocations are of interest; filter them once so that
+        # the patch loop only sees the addresses to be fixed up
+        targets = []
+        for reloc in section.iter_relocations():
+            if not reloc.is_RELA():
+                raise RuntimeError('unexpected REL reloc')
+            if reloc['r_info_type'] == R_68K_32:
+                targets.append(reloc['r_offset'])
+        return targets
 
     @property
     def entrypoint(self):
@@ -141,28 +173,31 @@ class ELFImage(object):
             return end + self._relocation + self._stack_size
 
     def _cache_symbols(self, section):
+        name_cache = self._name_cache
+        address_cache = self._address_cache
 
-        for nsym, symbol in enumerate(section.iter_symbols()):
+        # M68K ELF is always 32-bit big-endian, so rather than have pyelftools
+        # build a container for every symbol, unpack the table directly
+        strtab = self._elf.get_section(section['sh_link']).data()
 
-            s_name = str(symbol.name)
-            if len(s_name) == 0:
+        for st_name, s_addr, s_size, st_info, _, _ in struct.iter_unpack(ELF32_SYM_FORMAT, section.data()):
+
+            if (st_info & 0xf) == STT_FILE:
                 continue
-            s_type = symbol['st_info']['type']
-            if s_type == 'STT_FILE':
+            s_name = sys.intern(strtab[st_name:strtab.index(b'\0', st_name)].decode('latin-1'))
+            if not s_name:
                 continue
-            s_addr = symbol['st_value']
-            s_size = symbol['st_size']
 
-            self._name_cache[s_name] = {'address': s_addr, 'size': s_size}
+            name_cache[s_name] = (s_addr, s_size)
             try:
-                self._address_cache[s_addr].append(s_name)
+                address_cache[s_addr].append(s_name)
             except KeyError:
-                self._address_cache[s_addr] = [s_name]
+                address_cache[s_addr] = [s_name]
 
     def get_symbol_range(self, name):
         try:
-            addr = self._name_cache[name]['address'] + self._relocation
-            size = self._name_cache[name]['size']
+            addr, size = self._name_cache[name]
+            addr += self._relocation
         except KeyError:
             try:
                 addr = int(name)
@@ -173,20 +208,18 @@ class ELFImage(object):
         return addr, size + addr
 
     def get_symbol_name(self, address):
+        return self._symbol_name_cache(address)
+
+    def _lookup_symbol_name(self, address):
         address -= self._relocation
         if address in self._address_cache:
             return ','.join(self._address_cache[address])
-        index = bisect_left(self._symbol_index, address)
-        if not index:
-            return None
-        symbol_address = self._symbol_index[index - 1]
-        if address < symbol_address:
+        index = bisect_right(self._symbol_index, address) - 1
+        if index < 0:
             return None
-        names = list()
-        for name in self._address_cache[symbol_address]:
-            if (address - symbol_address) < self._name_cache[name]['size']:
-                names.append(name)
+        offset = address - self._symbol_index[index]
+        names = [name for name, size in self._symbol_ranges[index] if offset < size]
         if len(names) > 0:
-            label = ','.join(names) + f'+{address - symbol_address:#x}'
+            label = ','.join(names) + f'+{offset:#x}'
             return label
         return None
@@ -4,6 +4,8 @@
  * Conditional, latency-sensitive callbacks.
  */
 
+#include <stddef.h>
+
 #include "m68k.h"
 
 void    (*cb_pc_changed)(unsigned int new_pc);
@@ -36,3 +38,13 @@ instr_hook_callback(unsigned int pc)
         cb_instr(pc);
     }
 }
+
+/*
+ * Read a register from the current context; lets the Python wrapper
+ * skip passing a NULL context pointer on every call.
+ */
+unsigned int
+m68k_get_reg_current(int reg)
+{
+    return m68k_get_reg(NULL, (m68k_register_t)reg);
+}
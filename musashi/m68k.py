@@ -5,7 +5,10 @@
 # wrapper for musashi m68k CPU emulator
 #
 
+import glob
 import os
+import struct
+import sys
 from ctypes import *
 
 # --- Constants ---
@@ -82,26 +85,62 @@ MEM_WRITE = ord('W')
 INVALID_READ = ord('r')
 INVALID_WRITE = ord('w')
 MEM_MAP = ord('M')
+MEM_INSTR = ord('I')
 MEM_SIZE_8 = 8
 MEM_SIZE_16 = 16
 MEM_SIZE_32 = 32
 MEM_MAP_ROM = 0
 MEM_MAP_RAM = 1
 MEM_MAP_DEVICE = 2
+MEM_TRACE_BUFFER_ENTRIES = 4096
+MEM_TRACE_REGS = REG_ISP + 1     # registers snapshotted with each MEM_INSTR entry
+MEM_TRACE_INSN_BYTES = 24        # instruction bytes captured with each MEM_INSTR entry
 
 
 def find_lib():
     """ locate the Mushashi dylib """
     path = os.path.dirname(os.path.realpath(__file__))
-    all_files = os.listdir(path)
-    for f in all_files:
-        if f.find('libmusashi') != -1:
-            return os.path.join(path, f)
+
+    # try the name the Makefile builds before scanning the directory
+    lib_name = 'libmusashi.dylib' if sys.platform == 'darwin' else 'libmusashi.so'
+    lib_path = os.path.join(path, lib_name)
+    if os.path.exists(lib_path):
+        return lib_path
+
+    matches = glob.glob(os.path.join(path, 'libmusashi*'))
+    if len(matches) > 0:
+        return matches[0]
     raise ImportError("Can't find musashi native lib")
 
 
 lib_file = find_lib()
-lib = CDLL(lib_file)
+
+# Load as a PyDLL so that the GIL is held across calls into the library.
+# The emulator is single-threaded and nearly every call that does real work
+# (m68k_execute in particular) re-enters Python through the device / trace
+# callbacks; with CDLL each of those callbacks had to re-acquire the GIL
+# that the outer call had just released.
+lib = PyDLL(lib_file)
+
+__trampolines = dict()   # callback slot -> (func, ctypes trampoline)
+
+
+def _trampoline(slot, func_type, func):
+    """
+    Return the ctypes trampoline for func, reusing the existing one if func
+    is already installed in slot. Keeping it here also keeps it alive while
+    the native library holds a pointer to it.
+    """
+    try:
+        installed_func, trampoline = __trampolines[slot]
+        if installed_func == func:
+            return trampoline
+    except KeyError:
+        pass
+    trampoline = func_type(func)
+    __trampolines[slot] = (func, trampoline)
+    return trampoline
+
 
 # Musashi API
 
@@ -115,22 +154,28 @@ illg_instr_callback_func_type = CFUNCTYPE(c_int, c_uint)
 # instr_hook_callback_func_type = CFUNCTYPE(None, c_uint)
 
 
+lib.m68k_set_int_ack_callback.argtypes = [int_ack_callback_func_type]
+lib.m68k_set_int_ack_callback.restype = None
+lib.m68k_set_bkpt_ack_callback.argtypes = [bkpt_ack_callback_func_type]
+lib.m68k_set_bkpt_ack_callback.restype = None
+lib.m68k_set_reset_instr_callback.argtypes = [reset_instr_callback_func_type]
+lib.m68k_set_reset_instr_callback.restype = None
+lib.m68k_set_tas_instr_callback.argtypes = [tas_instr_callback_func_type]
+lib.m68k_set_tas_instr_callback.restype = None
+lib.m68k_set_illg_instr_callback.argtypes = [illg_instr_callback_func_type]
+lib.m68k_set_illg_instr_callback.restype = None
+
+
 def set_int_ack_callback(func):
-    global int_ack_callback
-    int_ack_callback = int_ack_callback_func_type(func)
-    lib.m68k_set_int_ack_callback(int_ack_callback)
+    lib.m68k_set_int_ack_callback(_trampoline('int_ack_callback', int_ack_callback_func_type, func))
 
 
 def set_bkpt_ack_callback(func):
-    global bkpt_ack_callback
-    bkpt_ack_callback = bkpt_ack_callback_func_type(func)
-    lib.m68k_set_bkpt_ack_callback(bkpt_ack_callback)
+    lib.m68k_set_bkpt_ack_callback(_trampoline('bkpt_ack_callback', bkpt_ack_callback_func_type, func))
 
 
 def set_reset_instr_callback(func):
-    global reset_instr_callback
-    reset_instr_callback = reset_instr_callback_func_type(func)
-    lib.m68k_set_reset_instr_callback(reset_instr_callback)
+    lib.m68k_set_reset_instr_callback(_trampoline('reset_instr_callback', reset_instr_callback_func_type, func))
 
 
 # def set_pc_changed_callback(func):
@@ -140,15 +185,11 @@ def set_reset_instr_callback(func):
 
 
 def set_tas_instr_callback(func):
-    global tas_instr_callback
-    tas_instr_callback = tas_instr_callback_func_type(func)
-    lib.m68k_set_tas_instr_callback(tas_instr_callback)
+    lib.m68k_set_tas_instr_callback(_trampoline('tas_instr_callback', tas_instr_callback_func_type, func))
 
 
 def set_illg_instr_callback(func):
-    global illg_instr_callback
-    illg_instr_callback = illg_instr_callback_func_type(func)
-    lib.m68k_set_illg_instr_callback(illg_instr_callback)
+    lib.m68k_set_illg_instr_callback(_trampoline('illg_instr_callback', illg_instr_callback_func_type, func))
 
 
 # def set_fc_callback(func):
@@ -163,15 +204,49 @@ def set_illg_instr_callback(func):
 #     lib.m68k_set_instr_hook_callback(instr_hook_callback)
 
 
+lib.m68k_set_cpu_type.argtypes = [c_uint]
+lib.m68k_set_cpu_type.restype = None
+lib.m68k_init.argtypes = []
+lib.m68k_init.restype = None
+lib.m68k_pulse_reset.argtypes = []
+lib.m68k_pulse_reset.restype = None
+lib.m68k_pulse_halt.argtypes = []
+lib.m68k_pulse_halt.restype = None
+lib.m68k_pulse_bus_error.argtypes = []
+lib.m68k_pulse_bus_error.restype = None
+lib.m68k_execute.argtypes = [c_int]
+lib.m68k_execute.restype = c_int
+lib.m68k_cycles_run.argtypes = []
+lib.m68k_cycles_run.restype = c_int
+lib.m68k_cycles_remaining.argtypes = []
+lib.m68k_cycles_remaining.restype = c_int
+lib.m68k_modify_timeslice.argtypes = [c_int]
+lib.m68k_modify_timeslice.restype = None
+lib.m68k_end_timeslice.argtypes = []
+lib.m68k_end_timeslice.restype = None
+lib.m68k_set_irq.argtypes = [c_uint]
+lib.m68k_set_irq.restype = None
+lib.m68k_set_virq.argtypes = [c_uint, c_uint]
+lib.m68k_set_virq.restype = None
+lib.m68k_get_virq.argtypes = [c_uint]
 lib.m68k_get_virq.restype = c_uint
+lib.m68k_get_reg.argtypes = [c_void_p, c_int]
 lib.m68k_get_reg.restype = c_uint
+lib.m68k_get_reg_current.argtypes = [c_int]
+lib.m68k_get_reg_current.restype = c_uint
+lib.m68k_set_reg.argtypes = [c_int, c_uint]
+lib.m68k_set_reg.restype = None
+lib.m68k_is_valid_instruction.argtypes = [c_uint, c_uint]
 lib.m68k_is_valid_instruction.restype = c_uint
+lib.m68k_disassemble.argtypes = [c_char_p, c_uint, c_uint]
 lib.m68k_disassemble.restype = c_uint
+lib.m68k_disassemble_raw.argtypes = [c_char_p, c_uint, c_char_p, c_void_p, c_uint]
+lib.m68k_disassemble_raw.restype = c_uint
 __dis_buf = create_string_buffer(100)
 
 
 def set_cpu_type(cpu_type):
-    lib.m68k_set_cpu_type(c_uint(cpu_type))
+    lib.m68k_set_cpu_type(cpu_type)
 
 
 def cpu_init():
@@ -182,36 +257,23 @@ def pulse_reset():
     lib.m68k_pulse_reset()
 
 
-def execute(cycles):
-    return lib.m68k_execute(c_int(cycles))
-
-
-def cycles_run():
-    return lib.m68k_cycles_run()
-
-
-def cycles_remaining():
-    return lib.m68k_cycles_remaining()
-
-
-def modify_timeslice(cycles):
-    lib.m68k_modify_timeslice(c_int(cycles))
-
-
-def end_timeslice():
-    lib.m68k_end_timeslice()
-
-
-def set_irq(level):
-    lib.m68k_set_irq(c_uint(level))
+# Functions on the hot path are bound directly to the ctypes function objects
+# (argtypes / restype above do all the conversion) to avoid an extra Python
+# frame per call.
+execute = lib.m68k_execute                      # execute(cycles)
+cycles_run = lib.m68k_cycles_run                # cycles_run()
+cycles_remaining = lib.m68k_cycles_remaining    # cycles_remaining()
+modify_timeslice = lib.m68k_modify_timeslice    # modify_timeslice(cycles)
+end_timeslice = lib.m68k_end_timeslice          # end_timeslice()
+set_irq = lib.m68k_set_irq                      # set_irq(level)
 
 
 def set_virq(level, active):
-    lib.m68k_set_virq(c_uint(level), c_uint(active))
+    lib.m68k_set_virq(level, active)
 
 
 def get_virq(level):
-    lib.m68k_get_virq(c_uint(level))
+    return lib.m68k_get_virq(level)
 
 
 def pulse_halt():
@@ -237,104 +299,172 @@ void m68k_state_register(const char *type, int index);
 """
 
 
-def get_reg(reg):
-    return lib.m68k_get_reg(None, c_int(reg))
-
-
-def set_reg(reg, value):
-    lib.m68k_set_reg(c_int(reg), c_uint(value))
+get_reg = lib.m68k_get_reg_current     # get_reg(reg)
+set_reg = lib.m68k_set_reg             # set_reg(reg, value)
 
 
 def is_valid_instruction(instr, cpu_type):
-    return lib.m68k_is_valid_instruction(c_uint(instr),
-                                         c_uint(cpu_type))
+    return lib.m68k_is_valid_instruction(instr, cpu_type)
 
 
 def disassemble(pc, cpu_type):
-    n = lib.m68k_disassemble(__dis_buf,
-                             c_uint(pc),
-                             c_uint(cpu_type))
+    lib.m68k_disassemble(__dis_buf, pc, cpu_type)
     return __dis_buf.value.decode('latin-1')
 
 
-"""
-unsigned int m68k_disassemble_raw(char* str_buff, unsigned int pc, const unsigned char* opdata, const unsigned char* argdata, unsigned int cpu_type);
-"""
+__dis_cache = dict()  # pc -> (cpu_type, instruction bytes, disassembly)
+__dis_cache_size = 4096
+
+
+def disassemble_raw(pc, opdata, cpu_type):
+    """
+    Disassemble the instruction in opdata as if it were at pc, rather than
+    whatever memory holds at pc now. opdata must cover the whole instruction,
+    e.g. the MEM_TRACE_INSN_BYTES captured with a MEM_INSTR trace entry.
+    """
+    try:
+        cached_type, contents, dis = __dis_cache[pc]
+        if (cached_type == cpu_type) and opdata.startswith(contents):
+            return dis
+    except KeyError:
+        pass
+    length = lib.m68k_disassemble_raw(__dis_buf, pc, opdata, None, cpu_type)
+    dis = __dis_buf.value.decode('latin-1')
+    if len(__dis_cache) >= __dis_cache_size:
+        __dis_cache.clear()
+    __dis_cache[pc] = (cpu_type, opdata[:length], dis)
+    return dis
+
 
 # Memory API
 
+lib.mem_add_memory.argtypes = [c_uint, c_uint, c_bool]
 lib.mem_add_memory.restype = c_bool
+lib.mem_add_device.argtypes = [c_uint, c_uint]
 lib.mem_add_device.restype = c_bool
+lib.mem_enable_mem_tracing.argtypes = [c_bool]
+lib.mem_enable_mem_tracing.restype = None
+lib.mem_enable_instr_tracing.argtypes = [c_bool]
+lib.mem_enable_instr_tracing.restype = None
+lib.mem_enable_bus_error.argtypes = [c_bool]
+lib.mem_enable_bus_error.restype = None
+lib.mem_read_memory.argtypes = [c_uint, c_uint]
 lib.mem_read_memory.restype = c_uint
+lib.mem_write_memory.argtypes = [c_uint, c_uint, c_uint]
+lib.mem_write_memory.restype = None
+lib.mem_read_bulk.argtypes = [c_uint, c_void_p, c_uint]
+lib.mem_read_bulk.restype = None
+lib.mem_write_bulk.argtypes = [c_uint, c_void_p, c_uint]
+lib.mem_write_bulk.restype = None
 
 device_handler_func_type = CFUNCTYPE(c_uint, c_uint, c_uint, c_uint, c_uint)
 trace_handler_func_type = CFUNCTYPE(None, c_uint, c_uint, c_uint, c_uint)
 instr_handler_func_type = CFUNCTYPE(None, c_uint)
+trace_flush_handler_func_type = CFUNCTYPE(None)
+
+lib.mem_set_device_handler.argtypes = [device_handler_func_type]
+lib.mem_set_device_handler.restype = None
+lib.mem_set_trace_handler.argtypes = [trace_handler_func_type]
+lib.mem_set_trace_handler.restype = None
+lib.mem_set_instr_handler.argtypes = [instr_handler_func_type]
+lib.mem_set_instr_handler.restype = None
+lib.mem_set_trace_flush_handler.argtypes = [trace_flush_handler_func_type]
+lib.mem_set_trace_flush_handler.restype = None
+
+lib.mem_trace_drain.argtypes = [c_void_p, c_void_p, c_void_p, c_uint]
+lib.mem_trace_drain.restype = c_uint
+__trace_buf = (c_uint * (4 * MEM_TRACE_BUFFER_ENTRIES))()
+__trace_regs = (c_uint * (MEM_TRACE_REGS * MEM_TRACE_BUFFER_ENTRIES))()
+__trace_insns = (c_ubyte * (MEM_TRACE_INSN_BYTES * MEM_TRACE_BUFFER_ENTRIES))()
 
 
 def mem_add_memory(base, size, writable=True):
-    return lib.mem_add_memory(c_uint(base),
-                              c_uint(size),
-                              c_bool(writable))
+    return lib.mem_add_memory(base, size, writable)
 
 
 def mem_add_device(base, size):
-    return lib.mem_add_device(c_uint(base),
-                              c_uint(size))
+    return lib.mem_add_device(base, size)
 
 
 def mem_set_device_handler(func):
-    global device_handler
-    device_handler = device_handler_func_type(func)
-    lib.mem_set_device_handler(device_handler)
+    lib.mem_set_device_handler(_trampoline('device_handler', device_handler_func_type, func))
 
 
 def mem_set_trace_handler(func):
-    global trace_handler
-    trace_handler = trace_handler_func_type(func)
-    lib.mem_set_trace_handler(trace_handler)
+    lib.mem_set_trace_handler(_trampoline('trace_handler', trace_handler_func_type, func))
+
+
+def mem_set_trace_flush_handler(func):
+    """
+    Buffer memory and instruction trace entries in the native library rather
+    than calling the trace / instruction handler for each one; func is called
+    when the buffer fills and should call mem_trace_drain()
+    """
+    lib.mem_set_trace_flush_handler(_trampoline('trace_flush_handler', trace_flush_handler_func_type, func))
+
+
+def mem_trace_drain():
+    """
+    Return buffered trace entries as a list of (operation, address, size, value)
+    tuples, oldest first, a flat list of register snapshots and the captured
+    instruction bytes. For the MEM_INSTR entry at index n, address is the PC,
+    the registers are at regs[n * MEM_TRACE_REGS + REG_*] and the instruction
+    is at insns[n * MEM_TRACE_INSN_BYTES:(n + 1) * MEM_TRACE_INSN_BYTES].
+    """
+    count = lib.mem_trace_drain(__trace_buf, __trace_regs, __trace_insns, MEM_TRACE_BUFFER_ENTRIES)
+    if count == 0:
+        return [], [], b''
+    entries = list(struct.iter_unpack('=4I', memoryview(__trace_buf).cast('B')[:count * 16]))
+    regs = memoryview(__trace_regs).cast('B').cast('I')[:count * MEM_TRACE_REGS].tolist()
+    insns = string_at(__trace_insns, count * MEM_TRACE_INSN_BYTES)
+    return entries, regs, insns
 
 
 def mem_set_instr_handler(func):
-    global instr_handler
-    instr_handler = instr_handler_func_type(func)
-    lib.mem_set_instr_handler(instr_handler)
+    lib.mem_set_instr_handler(_trampoline('instr_handler', instr_handler_func_type, func))
 
 
 def mem_enable_mem_tracing(enable=True):
-    lib.mem_enable_mem_tracing(c_bool(enable))
+    lib.mem_enable_mem_tracing(enable)
 
 
 def mem_enable_instr_tracing(enable=True):
-    lib.mem_enable_instr_tracing(c_bool(enable))
+    lib.mem_enable_instr_tracing(enable)
 
 
 def mem_enable_bus_error(enable=True):
-    lib.mem_enable_bus_error(c_bool(enable))
+    lib.mem_enable_bus_error(enable)
 
 
-def mem_read_memory(address, size):
-    return lib.mem_read_memory(c_uint(address), c_uint(size))
+mem_read_memory = lib.mem_read_memory      # mem_read_memory(address, size)
+mem_write_memory = lib.mem_write_memory    # mem_write_memory(address, size, value)
 
 
-def mem_write_memory(address, size, value):
-    lib.mem_write_memory(c_uint(address), c_uint(size), c_uint(value))
+def mem_read_bulk(address, size):
+    # one call for the whole block rather than one per byte / word
+    buffer = create_string_buffer(size)
+    lib.mem_read_bulk(address, buffer, size)
+    return buffer.raw
 
 
 def mem_write_bulk(address, buffer):
-    lib.mem_write_bulk(c_uint(address), c_char_p(bytes(buffer)), c_uint(len(buffer)))
+    # bytes are passed by reference; writable buffers (e.g. bytearray) are
+    # wrapped in place rather than copied
+    if not isinstance(buffer, bytes):
+        view = memoryview(buffer).cast('B')
+        if view.readonly:
+            buffer = view.tobytes()
+        else:
+            buffer = (c_ubyte * len(view)).from_buffer(view)
+    lib.mem_write_bulk(address, buffer, len(buffer))
 
 
 # Callback API
 
 
 def set_pc_changed_callback(func):
-    global pc_changed_callback
-    pc_changed_callback = pc_changed_callback_func_type(func)
-    lib.set_pc_changed_callback(pc_changed_callback)
+    lib.set_pc_changed_callback(_trampoline('pc_changed_callback', pc_changed_callback_func_type, func))
 
 
 def set_instr_hook_callback(func):
-    global instr_hook_callback
-    instr_hook_callback = instr_hook_callback_func_type(func)
-    lib.set_instr_hook_callback(instr_hook_callback)
+    lib.set_instr_hook_callback(_trampoline('instr_hook_callback', instr_hook_callback_func_type, func))
@@ -53,6 +53,12 @@ static mem_device_handler_t mem_dev_handler;
 static mem_trace_handler_t  mem_trace_handler;
 static mem_instr_handler_t  mem_instr_handler;
 
+static mem_trace_flush_handler_t mem_trace_flush_handler;
+static mem_trace_entry_t    mem_trace_buffer[MEM_TRACE_BUFFER_ENTRIES];
+static uint32_t             mem_trace_regs[MEM_TRACE_BUFFER_ENTRIES][MEM_TRACE_REGS];
+static uint8_t              mem_trace_insns[MEM_TRACE_BUFFER_ENTRIES][MEM_TRACE_INSN_BYTES];
+static uint32_t             mem_trace_count;
+
 static uint32_t             mem_fc;
 #define FC_IS_PROGRAM       ((mem_fc == 2) || (mem_fc == 6))
 #define FC_IS_DATA          ((mem_fc == 1) || (mem_fc == 5))
@@ -68,7 +74,29 @@ mem_set_fc(unsigned int new_fc)
 void
 mem_instr_callback(unsigned int pc)
 {
-    if (mem_instr_trace_enabled && (mem_instr_handler != NULL)) {
+    if (!mem_instr_trace_enabled) {
+        return;
+    }
+    if (mem_trace_flush_handler) {
+        // buffer the PC along with a register snapshot and the instruction
+        // bytes, since both registers and memory may have moved on by the
+        // time the buffer is drained
+        if (mem_trace_count < MEM_TRACE_BUFFER_ENTRIES) {
+            for (int reg = 0; reg < MEM_TRACE_REGS; reg++) {
+                mem_trace_regs[mem_trace_count][reg] = m68k_get_reg(NULL, (m68k_register_t)reg);
+            }
+            mem_read_bulk(pc, mem_trace_insns[mem_trace_count], MEM_TRACE_INSN_BYTES);
+            mem_trace_buffer[mem_trace_count++] = (mem_trace_entry_t){
+                .operation = MEM_INSTR,
+                .address = pc,
+                .size = 0,
+                .value = 0
+            };
+        }
+        if (mem_trace_count >= MEM_TRACE_BUFFER_ENTRIES) {
+            mem_trace_flush_handler();
+        }
+    } else if (mem_instr_handler) {
         mem_instr_handler(pc);
     }
 }
@@ -77,6 +105,14 @@ __attribute__((unused))
 static void
 mem_dump_pagetable()
 {
+    // the map doesn't change once the emulator is running, and walking it is
+    // expensive, so only dump it for the first bad access
+    static bool dumped = false;
+    if (dumped) {
+        return;
+    }
+    dumped = true;
+
     bool dots = false;
     for (uint32_t page = 0; page < MEM_NUM_PAGES; page += 64) {
         bool rowvalid = false;
@@ -120,10 +156,26 @@ mem_dump_pagetable()
 static void
 mem_trace(mem_operation_t operation, uint32_t address, uint32_t size, uint32_t value)
 {
-    if (mem_trace_enabled
-        && mem_trace_handler) {
+    if (!mem_trace_enabled) {
+        return;
+    }
+    if (mem_trace_flush_handler) {
+        // buffer the entry; the flush handler is expected to drain the
+        // buffer when it fills
+        if (mem_trace_count < MEM_TRACE_BUFFER_ENTRIES) {
+            mem_trace_buffer[mem_trace_count++] = (mem_trace_entry_t){
+                .operation = operation,
+                .address = address,
+                .size = size,
+                .value = value
+            };
+        }
+        if (mem_trace_count >= MEM_TRACE_BUFFER_ENTRIES) {
+            mem_trace_flush_handler();
+        }
+    } else if (mem_trace_handler) {
         mem_trace_handler(operation, address, size, value);
-    }   
+    }
 }
 
 static uint32_t
@@ -332,6 +384,28 @@ mem_set_trace_handler(mem_trace_handler_t handler)
     mem_trace_handler = handler;
 }
 
+void
+mem_set_trace_flush_handler(mem_trace_flush_handler_t handler)
+{
+    mem_trace_flush_handler = handler;
+}
+
+uint32_t
+mem_trace_drain(mem_trace_entry_t *buffer, uint32_t *regs, uint8_t *insns, uint32_t count)
+{
+    if (count > mem_trace_count) {
+        count = mem_trace_count;
+    }
+    memcpy(buffer, mem_trace_buffer, count * sizeof(mem_trace_entry_t));
+    memcpy(regs, mem_trace_regs, count * sizeof(mem_trace_regs[0]));
+    memcpy(insns, mem_trace_insns, count * sizeof(mem_trace_insns[0]));
+    mem_trace_count -= count;
+    memmove(mem_trace_buffer, mem_trace_buffer + count, mem_trace_count * sizeof(mem_trace_entry_t));
+    memmove(mem_trace_regs, mem_trace_regs + count, mem_trace_count * sizeof(mem_trace_regs[0]));
+    memmove(mem_trace_insns, mem_trace_insns + count, mem_trace_count * sizeof(mem_trace_insns[0]));
+    return count;
+}
+
 void
 mem_set_instr_handler(mem_instr_handler_t handler)
 {
@@ -341,13 +415,13 @@ mem_set_instr_handler(mem_instr_handler_t handler)
 void
 mem_enable_mem_tracing(bool enable)
 {
-    mem_trace_enabled = enable && mem_trace_handler;
+    mem_trace_enabled = enable && (mem_trace_handler || mem_trace_flush_handler);
 }
 
 void
 mem_enable_instr_tracing(bool enable)
 {
-    mem_instr_trace_enabled = enable && mem_trace_handler;
+    mem_instr_trace_enabled = enable && (mem_instr_handler || mem_trace_flush_handler);
 }
 
 void
@@ -417,6 +491,36 @@ mem_write_memory(uint32_t address, uint32_t size, uint32_t value)
     debug("ignored write @ 0x%x, size %d value 0x%x", address, size, value);
 }
 
+void
+mem_read_bulk(uint32_t address, uint8_t *buffer, uint32_t size)
+{
+    debug("bulk read 0x%x, to %p size %u", address, buffer, size);
+
+    while (size) {
+        pte_t       pte = mem_pagetable[address / MEM_PAGE_SIZE];
+        uint32_t    page_offset = address % MEM_PAGE_SIZE;
+        uint32_t    copy_size = MEM_PAGE_SIZE - page_offset;
+
+        if (copy_size > size) {
+            copy_size = size;
+        }
+
+        // unmapped and device pages read as zero, as for mem_read_memory
+        memset(buffer, 0, copy_size);
+        if (pte.valid
+            && !pte.device) {
+            mem_buffer_t *bp = mem_buffers + pte.id;
+            if (bp->buf) {
+                uint32_t buffer_offset = address - bp->base;
+                memcpy(buffer, bp->buf + buffer_offset, copy_size);
+            }
+        }
+        address += copy_size;
+        buffer += copy_size;
+        size -= copy_size;
+    }
+}
+
 void
 mem_write_bulk(uint32_t address, uint8_t *buffer, uint32_t size)
 {
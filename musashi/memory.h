@@ -8,6 +8,7 @@ typedef enum {
     INVALID_READ = 'r',
     INVALID_WRITE = 'w',
     MEM_MAP = 'M',
+    MEM_INSTR = 'I',
 } mem_operation_t;
 
 typedef enum {
@@ -39,6 +40,22 @@ typedef void (*mem_instr_handler_t)(uint32_t pc);
 void mem_set_trace_handler(mem_trace_handler_t handler);
 void mem_enable_mem_tracing(bool enable);
 
+typedef struct {
+    uint32_t    operation;
+    uint32_t    address;
+    uint32_t    size;
+    uint32_t    value;
+} mem_trace_entry_t;
+
+#define MEM_TRACE_BUFFER_ENTRIES    4096
+#define MEM_TRACE_REGS              (M68K_REG_ISP + 1)  // D0-D7, A0-A7, PC, SR, SP, USP, ISP
+#define MEM_TRACE_INSN_BYTES        24                  // longest 680x0 instruction is 22 bytes
+
+typedef void (*mem_trace_flush_handler_t)(void);
+
+void mem_set_trace_flush_handler(mem_trace_flush_handler_t handler);
+uint32_t mem_trace_drain(mem_trace_entry_t *buffer, uint32_t *regs, uint8_t *insns, uint32_t count);
+
 void mem_set_instr_handler(mem_instr_handler_t handler);
 void mem_enable_instr_tracing(bool enable);
 
@@ -49,4 +66,5 @@ bool mem_add_device(uint32_t base, uint32_t size);
 
 uint32_t mem_read_memory(uint32_t address, uint32_t size);
 void mem_write_memory(uint32_t address, mem_width_t width, uint32_t value);
+void mem_read_bulk(uint32_t address, uint8_t *buffer, uint32_t size);
 void mem_write_bulk(uint32_t address, uint8_t *buffer, uint32_t size);
@@ -8,7 +8,6 @@ import importlib
 from pathlib import Path
 import sys
 
-from consoleserver import ConsoleServer
 from device import Device
 from emulator import Emulator
 from systemdevices import RootDevice
@@ -49,6 +48,8 @@ if args.list_targets:
 
 # handle --console-server
 if args.console_server:
+    # imported here so that emulator runs don't pay for curses / vt102
+    from consoleserver import ConsoleServer
     ConsoleServer().run()
     sys.exit(0)
 
@@ -113,7 +113,8 @@ class Register:
     def access(cls, address, size, access, value=None):
         # XXX we could be smarter here and handle e.g. 16-bit access
         #     on top of an 8-bit or 32-bit register, etc.
-        return Register.lookup(address, size, access)._access(value)
+        # called for every device access, so index the table directly rather than via lookup()
+        return Register.__registers[(address, size, access)]._access(value)
 
     @classmethod
     def dump_registers(cls):
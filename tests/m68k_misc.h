@@ -222,3 +222,24 @@ nf_exit()
     }
     for (;;) ;
 }
+
+#define NF_CTRL_TRACE_STOP      1   // stop tracing
+#define NF_CTRL_TRACE_START     2   // arg = number of cycles to trace, 0 for no limit
+#define NF_CTRL_RUN_CYCLES      3   // arg = number of cycles before shutdown, 0 for no limit
+
+static bool
+__unused
+nf_ctrl(uint32_t cmd, uint32_t arg)
+{
+    static uint32_t nfid_ctrl = 0;
+
+    if (!nfid_ctrl) {
+        nfid_ctrl = nf_id("NF_CTRL");
+    }
+
+    if (nfid_ctrl) {
+        _nfCall(nfid_ctrl, cmd, arg);
+        return true;
+    }
+    return false;
+}
@@ -203,6 +203,14 @@ main(void)
         fprintf(stderr, "disk: tests pass\n");
     }
 
+    // an unhandled NF_CTRL traps to unexpected_exception
+    if (!nf_ctrl(NF_CTRL_TRACE_STOP, 0)) {
+        fprintf(stderr, "nf_ctrl: not supported\n");
+    } else {
+        nf_ctrl(NF_CTRL_RUN_CYCLES, 0);
+        fprintf(stderr, "nf_ctrl: tests pass\n");
+    }
+
     fprintf(stderr, "tests complete\n");
     fflush(stdout);
     nf_exit();
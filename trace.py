@@ -1,5 +1,9 @@
 # Tracing support
 
+import atexit
+import re
+import sys
+
 from imageELF import ELFImage
 from musashi import m68k
 
@@ -29,6 +33,7 @@ class Trace(object):
         'USP': m68k.REG_USP,
         'SSP': m68k.REG_ISP,
     }
+    register_pattern = re.compile(r'\b(' + '|'.join(registers) + r')\b')
 
     operation_map = {
         m68k.MEM_READ: 'READ',
@@ -38,6 +43,18 @@ class Trace(object):
         m68k.MEM_MAP: 'MAP'
     }
 
+    map_type_names = {
+        m68k.MEM_MAP_RAM: 'RAM',
+        m68k.MEM_MAP_ROM: 'ROM',
+        m68k.MEM_MAP_DEVICE: 'DEVICE'
+    }
+
+    value_formats = {
+        m68k.MEM_SIZE_8: '#04x',
+        m68k.MEM_SIZE_16: '#06x',
+        m68k.MEM_SIZE_32: '#010x'
+    }
+
     __global_tracer = None
     __emu = None
 
@@ -48,15 +65,20 @@ class Trace(object):
         else:
             raise RuntimeError('cannot have more than one Trace instance')
 
-        self._trace_file = open(args.trace_file, "w", 1)
+        # block-buffered; flushed by close() when the emulator finishes, or at
+        # interpreter exit if we die before getting there
+        self._trace_file = open(args.trace_file, "w", 1 << 20)
+        atexit.register(self.close)
         self._trace_memory = False
         self._trace_instructions = False
         self._trace_jumps = False
 
         self._symbol_files = list()
+        self._dis_registers = dict()    # disassembly -> ((name, REG_*), ...) for registers it mentions
 
-        m68k.mem_set_trace_handler(self.cb_trace_memory)
-        m68k.mem_set_instr_handler(self.cb_trace_instruction)
+        # memory / instruction trace entries are buffered by the native library
+        # and only handed to Python when the buffer fills or a trace line is cut
+        m68k.mem_set_trace_flush_handler(self.cb_trace_flush)
 
         if args.trace_memory or args.trace_everything:
             m68k.mem_enable_mem_tracing(True)
@@ -69,11 +91,13 @@ class Trace(object):
                 self.add_symbol_image(ELFImage(symfile, symbols_only=True))
 
     def close(self):
+        if self._trace_file.closed:
+            return
         try:
-            self._trace_file.flush()
-            self._trace_file.close()
+            self._drain_trace_buffer()
         except Exception:
             pass
+        self._trace_file.close()
 
     @classmethod
     def get_tracer(cls):
@@ -108,14 +132,17 @@ class Trace(object):
 
         action[10]: address/symbols[40] : info
         """
-        if address is not None:
-            symname = self._sym_for_address(address)
-            if symname is not None:
-                afield = '{} / {:#08x}'.format(symname, address)
-            else:
-                afield = '{:#08x}'.format(address)
-        else:
+        # memory / instruction trace entries are buffered by the native
+        # library; emit any that are pending so that the trace stays in order
+        self._drain_trace_buffer()
+        self._emit(action, address, info)
+
+    def _emit(self, action, address, info):
+        if address is None:
             afield = ''
+        else:
+            symname = self._sym_for_address(address)
+            afield = f'{address:#08x}' if symname is None else f'{symname} / {address:#08x}'
 
         self._trace_file.write(f'{action:<10}: {afield:>40} : {info.strip()}\n')
 
@@ -133,55 +160,67 @@ class Trace(object):
     def log(self, msg):
         self.trace(action='LOG', info=msg)
 
-    def cb_trace_memory(self, operation, addr, size, value):
-        """
-        Cut a memory trace entry
-        """
-        try:
-            action = self.operation_map[operation]
-            if operation == m68k.MEM_MAP:
-                if value == m68k.MEM_MAP_RAM:
-                    info = f'RAM {size:#x}'
-                elif value == m68k.MEM_MAP_ROM:
-                    info = f'ROM {size:#x}'
-                elif value == m68k.MEM_MAP_DEVICE:
-                    info = f'DEVICE {size:#x}'
-                else:
-                    raise RuntimeError(f'unexpected mapping type {value}')
-            else:
-                if size == m68k.MEM_SIZE_8:
-                    info = f'{value:#04x}'
-                elif size == m68k.MEM_SIZE_16:
-                    info = f'{value:#06x}'
-                elif size == m68k.MEM_SIZE_32:
-                    info = f'{value:#010x}'
+    def _drain_trace_buffer(self):
+        while True:
+            entries, regs, insns = m68k.mem_trace_drain()
+            if len(entries) == 0:
+                return
+            for index, (operation, addr, size, value) in enumerate(entries):
+                if operation == m68k.MEM_INSTR:
+                    insn_base = index * m68k.MEM_TRACE_INSN_BYTES
+                    self._emit_instruction(addr,
+                                           insns[insn_base:insn_base + m68k.MEM_TRACE_INSN_BYTES],
+                                           regs,
+                                           index * m68k.MEM_TRACE_REGS)
                 else:
-                    raise RuntimeError(f'unexpected trace size {size}')
+                    self._emit_memory(operation, addr, size, value)
 
-            self.trace(action, addr, info)
-
-        except Exception:
-            self.fatal_exception(sys.exc_info())
-
-        return 0
-
-    def cb_trace_instruction(self, pc):
+    def cb_trace_flush(self):
         """
-        Cut an instruction trace entry
+        Drain the native trace buffer when it fills
         """
         try:
-            dis = m68k.disassemble(pc, Trace.__emu._cpu_type)
-            reg_info = ''
-            for reg in self.registers:
-                if dis.find(reg) is not -1:
-                    reg_info += ' {}={:#x}'.format(reg, m68k.get_reg(self.registers[reg]))
-
-            self.trace(action='EXECUTE', address=pc, info=f'{dis:30} {reg_info}')
-            return
+            self._drain_trace_buffer()
+            # push the block out too, so that a native abort loses at most
+            # the entries buffered since
+            self._trace_file.flush()
 
         except Exception:
             Trace.__emu.fatal_exception(sys.exc_info())
 
+    def _emit_memory(self, operation, addr, size, value):
+        action = self.operation_map[operation]
+        if operation == m68k.MEM_MAP:
+            try:
+                info = f'{self.map_type_names[value]} {size:#x}'
+            except KeyError:
+                raise RuntimeError(f'unexpected mapping type {value}')
+        else:
+            try:
+                info = format(value, self.value_formats[size])
+            except KeyError:
+                raise RuntimeError(f'unexpected trace size {size}')
+
+        self._emit(action, addr, info)
+
+    def _emit_instruction(self, pc, insn, regs, regs_base):
+        # disassemble the bytes captured when the instruction executed, as the
+        # code at pc may have been overwritten since
+        dis = m68k.disassemble_raw(pc, insn, Trace.__emu._cpu_type)
+        try:
+            dis_registers = self._dis_registers[dis]
+        except KeyError:
+            # registers in the order they first appear in the disassembly
+            dis_registers = tuple((reg, self.registers[reg])
+                                  for reg in dict.fromkeys(self.register_pattern.findall(dis)))
+            self._dis_registers[dis] = dis_registers
+
+        reg_info = ''
+        for reg, reg_id in dis_registers:
+            reg_info += f' {reg}={regs[regs_base + reg_id]:#x}'
+
+        self._emit('EXECUTE', pc, f'{dis:30} {reg_info}')
+
     def add_symbol_image(self, elfImage):
         self._symbol_files.append(elfImage)
 